@@ -2,18 +2,27 @@ import webbrowser
 import platform
 import sys
 import os
+import importlib.util
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import subprocess
 import threading
 import queue
 import time
+import asyncio
+import collections
+import hashlib
+import functools
+import concurrent.futures
+import re
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QTextEdit, QLabel, QLineEdit,
     QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, QMessageBox, QSpinBox,
     QComboBox, QDoubleSpinBox, QProgressBar
 )
-from PySide6.QtCore import QTimer, Qt, Signal, QCoreApplication, QThread, QEvent, QObject
+from PySide6.QtCore import QTimer, Qt, Signal, QCoreApplication, QEvent, QObject, QSettings
 from PySide6.QtGui import QTextCharFormat, QFont, QColor, QTextCursor, QBrush
 import datetime
 import logging
@@ -21,6 +30,28 @@ from logging.handlers import RotatingFileHandler
 import soundfile as sf
 import numpy as np
 import pyaudio
+try:
+    import onnxruntime
+    import kokoro_onnx
+    _IMPORT_ERROR = None
+except ImportError as e:
+    # О проблеме сообщает main(): об отсутствии пакета — через find_spec, о сбое импорта (например, DLL load failed) — этой ошибкой
+    onnxruntime = None
+    kokoro_onnx = None
+    _IMPORT_ERROR = e
+
+KOKORO_SAMPLE_RATE = 24000
+SYNTHESIS_CACHE_MAX_ENTRIES = 128
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_PROGRESS_INTERVAL = 0.033
+HIGHLIGHT_INTERVAL_MS = 33
+
+# Общий пул фоновых задач (синтез, воспроизведение, загрузка модели, скачивание файлов). Его потоки дожидаются
+# при выходе, поэтому задачи обязаны завершаться: stop_tts_threads прерывает инференс и будит оба потока
+# маркерами конца, а closeEvent отменяет идущее скачивание.
+# Управляющий поток запуска ждёт задачи пула и поэтому работает вне пула, отдельным потоком-демоном
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(8, os.cpu_count() or 1), thread_name_prefix="tts")
+_SENTENCE_RE = re.compile(r'([^.!?]*)([.!?])')
 
 def setup_logging(log_file_path="kokoro.log"):
     logger = logging.getLogger("SynthesisLogger")
@@ -33,16 +64,67 @@ def setup_logging(log_file_path="kokoro.log"):
         logger.addHandler(handler)
     return logger
 
+def attach_run_options(kokoro_model):
+    """Передаёт общий RunOptions во все вызовы sess.run модели, чтобы идущий инференс можно было прервать через terminate."""
+    run_options = onnxruntime.RunOptions()
+    kokoro_model.sess.run = functools.partial(kokoro_model.sess.run, run_options=run_options)
+    return run_options
+
+def drain_queue(q):
+    """Очищает очередь за одно взятие её внутренней блокировки и будит потоки, ждущие места в put()."""
+    with q.mutex:
+        q.queue.clear()
+        q.not_full.notify_all()
+
+def split_text_into_sentences(text):
+    """Разделяет текст на предложения по знакам препинания ., !, ? и возвращает список предложений."""
+    # Каждое совпадение — текст до знака и сам знак; хвост без [.!?] не совпадает и игнорируется
+    sentences = []
+    for match in _SENTENCE_RE.finditer(text):
+        sentence_text = match.group(1).strip()
+        if sentence_text: # Добавляем только непустые предложения
+            sentences.append(sentence_text + match.group(2))
+    return sentences
+
+class SynthesisCache:
+    def __init__(self, max_entries=SYNTHESIS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, voice, speed, lang):
+        return hashlib.md5(f"{text}|{voice}|{speed}|{lang}".encode("utf-8")).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 class WorkerSignals(QObject):
     status_signal = Signal(str)
-    finished = Signal()
+    finished = Signal(int)
     available_voices_signal = Signal(list)
+    model_loaded_signal = Signal(str, object, object, list)
+    model_load_error_signal = Signal(str, str)
     highlight_line_signal = Signal(int)
     clear_highlight_signal = Signal()
 
-class TTSWorker(QThread):
-    def __init__(self, text, voice, speed, lang, logger, signals, line_count):
-        super().__init__()
+class TTSWorker:
+    def __init__(self, text, voice, speed, lang, logger, signals, line_count, kokoro_model, synthesis_cache, inference_lock, run_options):
         self.text = text
         self.voice = voice
         self.speed = speed
@@ -50,89 +132,106 @@ class TTSWorker(QThread):
         self.logger = logger
         self.signals = signals
         self.line_count = line_count
-        self.kokoro_model = None
-        self.kokoro_model_path = os.path.expanduser("~/.cache/kokoro/kokoro-v1.0.onnx")
-        self.kokoro_voices_path = os.path.expanduser("~/.cache/kokoro/voices-v1.0.bin")
+        self.kokoro_model = kokoro_model
+        self.synthesis_cache = synthesis_cache
+        self.inference_lock = inference_lock
+        self.run_options = run_options
         self.kokoro_voice = self.voice
         self.kokoro_speed = self.speed
         self.kokoro_lang = self.lang
-        self.tts_task_queue = queue.Queue(maxsize=2)
-        self.audio_playback_queue = queue.Queue(maxsize=5)
+        self.tts_task_queue = queue.Queue(maxsize=16)
+        self.audio_playback_queue = queue.Queue(maxsize=32)
         self.tts_stop_event = threading.Event()
         self.tts_skip_event = threading.Event()
         self._threads_stopped = False
+        self.non_empty_count = 0
+        self._run_thread = None
+        self.tts_synthesis_future = None
+        self.tts_playback_future = None
         self.actual_available_voices = []
+        self._pa = None
+        self._stream = None
+        self._stream_rate = None
+        self._stream_loop = None
+
+    def start(self):
+        self._run_thread = threading.Thread(target=self.run, name="tts-controller", daemon=True)
+        self._run_thread.start()
+
+    def wait(self):
+        if self._run_thread is not None:
+            self._run_thread.join()
 
     def run(self):
-        synthesis_thread_started = False
-        playback_thread_started = False
         try:
-            import kokoro_onnx
-            if self.kokoro_model is None:
-                self.kokoro_model = kokoro_onnx.Kokoro(self.kokoro_model_path, self.kokoro_voices_path)
-                try:
-                    self.actual_available_voices = self.kokoro_model.get_voices()
-                    self.logger.debug(f"Actual available voices loaded from model: {self.actual_available_voices}")
-                except Exception as e:
-                    self.logger.error(f"Could not get voices from model: {e}")
-                    self.actual_available_voices = ["af_heart"]
+            try:
+                self.actual_available_voices = self.kokoro_model.get_voices()
+                self.logger.debug(f"Actual available voices loaded from model: {self.actual_available_voices}")
+            except Exception as e:
+                self.logger.error(f"Could not get voices from model: {e}")
+                self.actual_available_voices = ["af_heart"]
+
+            self.open_audio_stream(KOKORO_SAMPLE_RATE)
 
             lines = self.text.split('\n')
+            if self.run_options is not None:
+                # Сбрасывается один раз до запуска потоков: запрос остановки, пришедший позже, уже никто не сотрёт
+                self.run_options.terminate = False
             self.tts_stop_event.clear()
             self.tts_skip_event.clear()
             self._threads_stopped = False
-            self.tts_synthesis_thread = threading.Thread(target=self.tts_synthesis_worker, daemon=True)
-            self.tts_synthesis_thread.start()
-            synthesis_thread_started = True
-            self.tts_playback_thread = threading.Thread(target=self.tts_playback_worker, daemon=True)
-            self.tts_playback_thread.start()
-            playback_thread_started = True
+            self.tts_synthesis_future = _executor.submit(self.tts_synthesis_worker)
+            self.tts_playback_future = _executor.submit(self.tts_playback_worker)
 
             self.split_and_queue_text_parts(lines)
 
-            self.tts_task_queue.join()
-            if synthesis_thread_started and self.tts_synthesis_thread:
-                 self.logger.debug("TTSWorker: Waiting for Synthesis Thread to finish naturally...")
-                 self.tts_synthesis_thread.join()
-                 self.logger.debug("TTSWorker: Synthesis Thread finished naturally.")
-            if playback_thread_started and self.tts_playback_thread:
-                 self.logger.debug("TTSWorker: Waiting for Playback Thread to finish naturally...")
-                 self.tts_playback_thread.join()
-                 self.logger.debug("TTSWorker: Playback Thread finished naturally.")
+            self.logger.debug("TTSWorker: Waiting for Synthesis Thread to finish naturally...")
+            concurrent.futures.wait([self.tts_synthesis_future])
+            self.logger.debug("TTSWorker: Synthesis Thread finished naturally.")
+            self.logger.debug("TTSWorker: Waiting for Playback Thread to finish naturally...")
+            concurrent.futures.wait([self.tts_playback_future])
+            self.logger.debug("TTSWorker: Playback Thread finished naturally.")
         except Exception as e:
             print(f"Critical TTS Worker Error: {e}")
             self.logger.exception(f"Critical TTS Worker Error: {e}")
         finally:
             self.stop_tts_threads()
+            if self.tts_playback_future is None:
+                # Воспроизведение не запускалось — поток PyAudio больше никем не используется
+                self.close_audio_stream()
             self.signals.clear_highlight_signal.emit()
-            non_empty_lines_count = len([line for line in self.text.split('\n') if line.strip()])
-            self.logger.info(str(non_empty_lines_count))
+            self.logger.info(str(self.non_empty_count))
             self.signals.status_signal.emit("Ready")
-            self.signals.finished.emit()
+            self.signals.finished.emit(self.non_empty_count)
 
     def split_and_queue_text_parts(self, lines):
-        self.tts_skip_event.clear()
-        self.logger.debug("TTS Skip event cleared for new text.")
         for i, part in enumerate(lines):
-            if part.strip():
-                task_tuple = ("speak", part.strip(), i)
+            part = part.strip()
+            if part:
+                if self.tts_stop_event.is_set():
+                    self.logger.debug("Stop requested while queueing text. Remaining parts dropped.")
+                    return
+                self.non_empty_count += 1
+                # start_synthesis уже разбил текст по строке на предложение, поэтому строка — одна задача
+                task_tuple = ("speak", part, i)
                 self.tts_task_queue.put(task_tuple, block=True)
-                self.logger.debug(f"Queued TTS part ({i+1}/{len(lines)}): {part.strip()[:30]}...")
+                self.logger.debug(f"Queued TTS part ({i+1}/{len(lines)}): {part[:30]}...")
+        # Маркер конца текста: поток синтеза передаст его потоку воспроизведения и оба завершатся
+        self.tts_task_queue.put(None)
 
     def tts_synthesis_worker(self):
         self.logger.debug("TTS Synthesis Thread Started.")
-        while not self.tts_stop_event.is_set():
+        while True:
             try:
-                try:
-                    task_type, text, line_index = self.tts_task_queue.get_nowait()
-                except queue.Empty:
-                    time.sleep(0.01)
-                    continue
+                item = self.tts_task_queue.get()
+                if item is None:
+                    self.logger.debug("TTS Synthesis Thread: End of text reached.")
+                    break
 
+                task_type, text, line_index = item
                 if task_type == "speak":
                     if self.tts_skip_event.is_set():
                         self.logger.debug("TTS Synthesis Thread: Skip requested, discarding task.")
-                        self.tts_task_queue.task_done()
                         continue
 
                     if self.kokoro_model:
@@ -148,132 +247,177 @@ class TTSWorker(QThread):
                                     self.logger.info(f"Switching to first available voice '{effective_voice}'.")
                                 else:
                                     self.logger.error("No voices available to synthesize speech!")
-                                    self.tts_task_queue.task_done()
                                     continue
 
-                            samples, sample_rate = self.kokoro_model.create(
-                                text,
-                                voice=effective_voice,
-                                speed=self.kokoro_speed,
-                                lang=self.kokoro_lang
-                            )
-                            self.logger.debug(f"TTS Synthesis Thread: Audio created. Length: {len(samples)}, Sample Rate: {sample_rate}")
-
-                            if self.tts_stop_event.is_set():
-                                self.logger.debug("TTS Synthesis Thread: Stop requested during synthesis. Discarding audio.")
-                                self.tts_task_queue.task_done()
-                                break
-
-                            if self.tts_skip_event.is_set():
-                                self.logger.debug("TTS Synthesis Thread: Skip requested after synthesis. Discarding audio for playback.")
-                                self.tts_task_queue.task_done()
-                                continue
-
-                            if not isinstance(samples, np.ndarray):
-                                samples = np.array(samples, dtype=np.float32)
-                            if samples.dtype != np.float32:
-                                samples = samples.astype(np.float32)
-
-                            if not self.tts_stop_event.is_set() and not self.tts_skip_event.is_set():
+                            cache_key = SynthesisCache.make_key(text, effective_voice, self.kokoro_speed, self.kokoro_lang)
+                            cached = self.synthesis_cache.get(cache_key)
+                            if cached is not None:
+                                samples, sample_rate = cached
+                                self.logger.debug(f"TTS Synthesis Thread: Cache hit for line {line_index + 1}.")
                                 self.audio_playback_queue.put(("play", samples, sample_rate, line_index))
                             else:
-                               self.logger.debug("TTS Synthesis Thread: Stop or Skip requested after synthesis. Discarding audio for playback.")
+                                chunks = []
+                                completed = True
+                                with self.inference_lock:
+                                    if self.tts_skip_event.is_set():
+                                        # Остановка пришла, пока поток ждал блокировку инференса
+                                        completed = False
+                                    else:
+                                        stream = self.synthesize_stream(text, effective_voice)
+                                        try:
+                                            for samples, sample_rate in stream:
+                                                if self.tts_skip_event.is_set():
+                                                    completed = False
+                                                    break
+                                                # kokoro_onnx всегда отдаёт непрерывный float32 ndarray; проверка снимается при python -O
+                                                assert samples.dtype == np.float32 and samples.flags.c_contiguous
+                                                chunks.append(samples)
+                                                self.audio_playback_queue.put(("play", samples, sample_rate, line_index))
+                                        finally:
+                                            stream.close()
+                                self.logger.debug(f"TTS Synthesis Thread: Audio streamed. Chunks: {len(chunks)}, Sample Rate: {sample_rate if chunks else '-'}")
+                                if completed and chunks:
+                                    # Короткие предложения приходят одним фрагментом — кэшируем его без копирования
+                                    cached_samples = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+                                    self.synthesis_cache.put(cache_key, (cached_samples, sample_rate))
+                                else:
+                                    self.logger.debug("TTS Synthesis Thread: Skip requested during synthesis. Discarding audio for playback.")
                         except Exception as e:
-                            self.logger.exception(f"TTS Synthesis Thread Error: {e}")
+                            if self.tts_skip_event.is_set():
+                                self.logger.debug(f"TTS Synthesis Thread: Inference interrupted by stop request: {e}")
+                            else:
+                                self.logger.exception(f"TTS Synthesis Thread Error: {e}")
                     else:
                         self.logger.error("TTS Synthesis Thread: Kokoro model not initialized.")
-
-                self.tts_task_queue.task_done()
-            except queue.Empty:
-                continue
             except Exception as e:
                 self.logger.exception(f"Unexpected error in TTS Synthesis Thread: {e}")
 
+        self.audio_playback_queue.put(None)
+        self.close_stream_loop()
         self.logger.debug("TTS Synthesis Thread Finished.")
 
+    def synthesize_stream(self, text, voice):
+        if not hasattr(self.kokoro_model, "create_stream"):
+            yield self.kokoro_model.create(text, voice=voice, speed=self.kokoro_speed, lang=self.kokoro_lang)
+            return
+        # create_stream — асинхронный генератор, поэтому крутим его в собственном цикле событий потока синтеза
+        if self._stream_loop is None:
+            self._stream_loop = asyncio.new_event_loop()
+            self._stream_loop.set_exception_handler(
+                lambda loop, context: self.logger.debug(f"TTS Synthesis Thread: Stream task error: {context.get('exception') or context.get('message')}")
+            )
+        stream = self.kokoro_model.create_stream(text, voice=voice, speed=self.kokoro_speed, lang=self.kokoro_lang)
+        try:
+            while True:
+                try:
+                    chunk = self._stream_loop.run_until_complete(self.next_stream_chunk(stream))
+                except StopAsyncIteration:
+                    break
+                if chunk is None:
+                    self.logger.debug("TTS Synthesis Thread: Stream cancelled by stop request.")
+                    break
+                yield chunk
+        finally:
+            self._stream_loop.run_until_complete(stream.aclose())
+
+    async def next_stream_chunk(self, stream):
+        # Прерванный через terminate инференс роняет задачу-производителя create_stream и следующий фрагмент
+        # никогда не придёт, поэтому ожидание периодически проверяет запрос остановки
+        next_chunk = asyncio.ensure_future(stream.__anext__())
+        while True:
+            done, _ = await asyncio.wait({next_chunk}, timeout=0.1)
+            if done:
+                return next_chunk.result()
+            if self.tts_skip_event.is_set():
+                next_chunk.cancel()
+                await asyncio.wait({next_chunk})
+                return None
+
+    def close_stream_loop(self):
+        if self._stream_loop is None:
+            return
+        try:
+            pending = asyncio.all_tasks(self._stream_loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._stream_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._stream_loop.close()
+        except Exception as e:
+            self.logger.warning(f"Error closing synthesis event loop: {e}")
+        self._stream_loop = None
+
     def tts_playback_worker(self):
         self.logger.debug("TTS Playback Thread Started.")
-        while not self.tts_stop_event.is_set():
+        highlighted_line = -1
+        while True:
             try:
-                try:
-                    task_type, samples, sample_rate, line_index = self.audio_playback_queue.get_nowait()
-                except queue.Empty:
-                    if self.tts_stop_event.is_set():
-                        self.logger.debug("TTS Playback Thread: Stop requested while waiting for queue item. Exiting.")
-                        break
-                    time.sleep(0.01)
-                    continue
+                item = self.audio_playback_queue.get()
+                if item is None:
+                    self.logger.debug("TTS Playback Thread: End of audio reached.")
+                    break
 
+                task_type, samples, sample_rate, line_index = item
                 if task_type == "play":
                     if self.tts_skip_event.is_set():
                          self.logger.debug("TTS Playback Thread: Skip requested, discarding audio.")
-                         self.audio_playback_queue.task_done()
                          continue
 
-                    try:
-                        print(f"[PLAYBACK] Starting for line {line_index + 1}")
-                        self.signals.highlight_line_signal.emit(line_index)
-                    except Exception as e:
-                        self.logger.warning(f"Could not highlight line {line_index} during playback: {e}")
+                    if line_index != highlighted_line:
+                        try:
+                            self.signals.highlight_line_signal.emit(line_index)
+                            highlighted_line = line_index
+                        except Exception as e:
+                            self.logger.warning(f"Could not highlight line {line_index} during playback: {e}")
 
-                    p = None
-                    stream = None
                     try:
-                        p = pyaudio.PyAudio()
-                        stream = p.open(
-                            format=pyaudio.paFloat32,
-                            channels=1,
-                            rate=sample_rate,
-                            output=True
-                        )
-                        self.logger.debug("TTS Playback Thread: Starting playback via PyAudio...")
-                        if self.tts_stop_event.is_set():
-                            self.logger.debug("TTS Playback Thread: Stop requested before write. Skipping write.")
-                            self.audio_playback_queue.task_done()
-                            break
-
                         if len(samples) == 0:
                             self.logger.warning(f"TTS Playback Thread: Received empty audio data for line {line_index + 1}. Skipping playback.")
-                            print(f"[WARNING] Skipping playback for empty audio on line {line_index + 1}")
                         else:
-                            stream.write(samples.tobytes())
+                            if self._stream is None or sample_rate != self._stream_rate:
+                                self.open_audio_stream(sample_rate)
+                            self.logger.debug("TTS Playback Thread: Starting playback via PyAudio...")
+                            # PyAudio принимает только bytes: memoryview отклоняется при разборе аргументов write_stream
+                            self._stream.write(samples.tobytes())
                             self.logger.debug("TTS Playback Thread: Playback via PyAudio finished.")
-                            print(f"[PLAYBACK] Finished for line {line_index + 1}")
 
                     except Exception as e:
                         self.logger.exception(f"TTS Playback Thread Error during playback/write for line {line_index + 1}: {e}")
-                        print(f"[ERROR] TTS Playback Error for line {line_index + 1}: {e}")
-                    finally:
-                        if stream:
-                            try:
-                                stream.stop_stream()
-                                stream.close()
-                            except Exception as e:
-                                self.logger.warning(f"Error closing stream for line {line_index + 1}: {e}")
-                        if p:
-                            try:
-                                p.terminate()
-                            except Exception as e:
-                                self.logger.warning(f"Error terminating PyAudio for line {line_index + 1}: {e}")
-
-                    if self.tts_stop_event.is_set():
-                         self.logger.debug("TTS Playback Thread: Stop requested after playback. Exiting.")
-                         self.audio_playback_queue.task_done()
-                         break
-
-                self.audio_playback_queue.task_done()
-            except queue.Empty:
-                if self.tts_stop_event.is_set():
-                    self.logger.debug("TTS Playback Thread: Stop requested while waiting for queue item. Exiting.")
-                    break
-                continue
             except Exception as e:
                 self.logger.exception(f"Unexpected error in TTS Playback Thread: {e}")
-                print(f"[ERROR] Unexpected TTS Playback Thread Error: {e}")
-                continue
 
+        # Поток PyAudio закрывает только пишущий в него поток: закрытие из другого потока во время write небезопасно
+        self.close_audio_stream()
         self.logger.debug("TTS Playback Thread Finished.")
 
+    def open_audio_stream(self, sample_rate):
+        self.close_audio_stream()
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            format=pyaudio.paFloat32,
+            channels=1,
+            rate=sample_rate,
+            output=True
+        )
+        self._stream_rate = sample_rate
+        self.logger.debug(f"TTSWorker: Opened PyAudio output stream at {sample_rate} Hz.")
+
+    def close_audio_stream(self):
+        if self._stream:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception as e:
+                self.logger.warning(f"Error closing audio stream: {e}")
+            self._stream = None
+            self._stream_rate = None
+        if self._pa:
+            try:
+                self._pa.terminate()
+            except Exception as e:
+                self.logger.warning(f"Error terminating PyAudio: {e}")
+            self._pa = None
+
     def stop_tts_threads(self):
         if self._threads_stopped:
             self.logger.debug("TTS threads already stopped.")
@@ -282,28 +426,24 @@ class TTSWorker(QThread):
         self.tts_stop_event.set()
         self.tts_skip_event.set()
         self._threads_stopped = True
+        if self.run_options is not None:
+            # Прерывает текущий вызов sess.run, чтобы поток синтеза не ждал конца инференса
+            self.run_options.terminate = True
         self.logger.debug("Clearing TTS task and audio queues...")
-        try:
-            while True:
-                self.tts_task_queue.get_nowait()
-                self.tts_task_queue.task_done()
-        except queue.Empty:
-            pass
-        try:
-            while True:
-                self.audio_playback_queue.get_nowait()
-                self.audio_playback_queue.task_done()
-        except queue.Empty:
-            pass
-        if self.tts_synthesis_thread and self.tts_synthesis_thread.is_alive():
+        drain_queue(self.tts_task_queue)
+        drain_queue(self.audio_playback_queue)
+        # Маркеры конца будят потоки, ждущие в get(); после очистки место в очередях гарантировано
+        self.tts_task_queue.put_nowait(None)
+        self.audio_playback_queue.put_nowait(None)
+        if self.tts_synthesis_future and not self.tts_synthesis_future.done():
             self.logger.debug("Waiting for TTS Synthesis Thread to finish...")
-            self.tts_synthesis_thread.join(timeout=1.0)
-            if self.tts_synthesis_thread.is_alive():
-                self.logger.debug("TTS Synthesis Thread did not finish in time (likely blocked in kokoro.create or waiting for queue item).")
-        if self.tts_playback_thread and self.tts_playback_thread.is_alive():
+            concurrent.futures.wait([self.tts_synthesis_future], timeout=1.0)
+            if not self.tts_synthesis_future.done():
+                self.logger.debug("TTS Synthesis Thread did not finish in time (likely blocked in kokoro.create).")
+        if self.tts_playback_future and not self.tts_playback_future.done():
             self.logger.debug("Waiting for TTS Playback Thread to finish...")
-            self.tts_playback_thread.join(timeout=1.0)
-            if self.tts_playback_thread.is_alive():
+            concurrent.futures.wait([self.tts_playback_future], timeout=1.0)
+            if not self.tts_playback_future.done():
                 self.logger.debug("TTS Playback Thread did not finish in time (likely blocked in pyaudio.Stream.write or waiting for queue item).")
         self.logger.debug("TTS threads stop process completed.")
 
@@ -323,28 +463,63 @@ class TextToSpeechGUI(QMainWindow):
         else:
             self.script_dir = Path(__file__).parent
 
-        self.model_path = self.cache_dir / "kokoro-v1.0.onnx"
+        self.model_variants = {
+            "fp32": self.cache_dir / "kokoro-v1.0.onnx",
+            "fp16": self.cache_dir / "kokoro-v1.0.fp16.onnx",
+            "int8": self.cache_dir / "kokoro-v1.0.int8.onnx"
+        }
         self.voices_path = self.cache_dir / "voices-v1.0.bin"
-        self.model_files = {
-            self.model_path: "https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files-v1.0/kokoro-v1.0.onnx",
+        self.model_urls = {
+            self.model_variants["fp32"]: "https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files-v1.0/kokoro-v1.0.onnx",
+            self.model_variants["fp16"]: "https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files-v1.0/kokoro-v1.0.fp16.onnx",
+            self.model_variants["int8"]: "https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files-v1.0/kokoro-v1.0.int8.onnx",
             self.voices_path: "https://github.com/thewh1teagle/kokoro-onnx/releases/download/model-files-v1.0/voices-v1.0.bin"
         }
+        self.settings = QSettings("ItIsAllForKira", "TTS-kokoro_onnx-GUI")
+        self.model_precision = self.initial_model_precision()
+        self.select_model_files(self.model_precision)
 
         self.current_directory = os.getcwd()
+        self.current_download = None
+        self.kokoro_model = None
+        self.run_options = None
+        self.synthesis_cache = SynthesisCache()
+        self.inference_lock = threading.Lock()
+        self.download_session = requests.Session()
+        download_retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+        self.download_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=download_retry))
         self.setup_ui()
-        self.check_and_download_models()
         self.audio_file_path = None
         self.available_voices = []
         self.tts_worker = None
         self.tts_signals = WorkerSignals()
         self.tts_signals.status_signal.connect(self.status_label.setText)
         self.tts_signals.finished.connect(self.on_tts_finished)
-        self.tts_signals.highlight_line_signal.connect(self.highlight_line)
+        self.tts_signals.highlight_line_signal.connect(self.schedule_highlight)
         self.tts_signals.clear_highlight_signal.connect(self.clear_highlight)
+        self.tts_signals.available_voices_signal.connect(self.on_voices_loaded)
+        self.tts_signals.model_loaded_signal.connect(self.on_model_loaded)
+        self.tts_signals.model_load_error_signal.connect(self.on_model_load_error)
         self.synthesis_active = False
         self.original_text_color = self.text_edit.textColor()
         self.original_text_bg_color = self.text_edit.palette().window().color()
         self.previous_highlighted_line = -1
+        self._prev_block = None
+        # Подсветка применяется не чаще ~30 раз в секунду, промежуточные строки пропускаются
+        self._pending_highlight = -1
+        self._highlight_timer = QTimer(self)
+        self._highlight_timer.setSingleShot(True)
+        self._highlight_timer.timeout.connect(self._flush_highlight)
+        self._last_highlight_flush = 0.0
+        # Форматы подсветки создаются один раз и переиспользуются при каждой смене строки
+        self._highlight_fmt = QTextCharFormat()
+        self._highlight_fmt.setForeground(QBrush(QColor(0, 0, 255)))
+        self._highlight_fmt.setFontWeight(QFont.Weight.Bold)
+        self._clear_fmt = QTextCharFormat()
+        self._clear_fmt.clearBackground()
+        self._clear_fmt.clearForeground()
+        self._clear_fmt.setFontWeight(QFont.Weight.Normal)
+        self.check_and_download_models()
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -364,6 +539,12 @@ class TextToSpeechGUI(QMainWindow):
         text_input_layout = QVBoxLayout()
         text_input_layout.addWidget(QLabel("Enter text to be read aloud:"))
         self.text_edit = QTextEdit()
+        # Ввод и вставка могут принести форматирование — полный сброс перед синтезом нужен, только если документ
+        # менялся с прошлого сброса. Подсветка не в счёт: clear_highlight сам возвращает формат своей строки
+        self._needs_clear = True
+        self._applying_highlight = False
+        self.text_edit.textChanged.connect(self.mark_text_dirty)
+        self.text_edit.document().contentsChange.connect(self.on_contents_change)
         self.text_edit.setMinimumHeight(300)
         self.text_edit.setPlaceholderText("Enter text here...\nCan enter multi-line text")
         # --- ВНЕДРЕНИЕ СТИЛЯ ДЛЯ ФИКСАЦИИ ЦВЕТА ---
@@ -396,6 +577,15 @@ class TextToSpeechGUI(QMainWindow):
         speed_layout.addWidget(self.speed_spinbox)
         settings_layout.addLayout(speed_layout)
 
+        precision_layout = QVBoxLayout()
+        precision_layout.addWidget(QLabel("Model precision:"))
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItems(list(self.model_variants.keys()))
+        self.precision_combo.setCurrentText(self.model_precision)
+        self.precision_combo.currentTextChanged.connect(self.on_precision_changed)
+        precision_layout.addWidget(self.precision_combo)
+        settings_layout.addLayout(precision_layout)
+
         main_layout.addLayout(settings_layout)
 
         self.progress_bar = QProgressBar()
@@ -424,6 +614,39 @@ class TextToSpeechGUI(QMainWindow):
         self.download_status_label = QLabel("")
         main_layout.addWidget(self.download_status_label)
 
+    def initial_model_precision(self):
+        saved = self.settings.value("model_precision", "", type=str)
+        if saved in self.model_variants:
+            return saved
+        # Без сохранённого выбора берём уже скачанный вариант, чтобы не просить загрузку заново;
+        # для новой установки — fp16: вдвое меньше fp32, а int8 на некоторых рантаймах медленнее
+        if not self.model_variants["fp16"].exists():
+            for precision, path in self.model_variants.items():
+                if path.exists():
+                    return precision
+        return "fp16"
+
+    def select_model_files(self, precision):
+        self.model_path = self.model_variants[precision]
+        self.model_files = {
+            self.model_path: self.model_urls[self.model_path],
+            self.voices_path: self.model_urls[self.voices_path]
+        }
+
+    def on_precision_changed(self, precision):
+        if precision == self.model_precision:
+            return
+        if self.synthesis_active:
+            self.stop_synthesis()
+        self.model_precision = precision
+        self.settings.setValue("model_precision", precision)
+        self.select_model_files(precision)
+        self.kokoro_model = None
+        self.run_options = None
+        self.synthesis_cache.clear()
+        self.logger.debug(f"Model precision switched to {precision}: {self.model_path}")
+        self.check_and_download_models()
+
     def check_and_download_models(self):
         missing = [str(f) for f in self.model_files if not f.exists()]
         if missing:
@@ -432,39 +655,85 @@ class TextToSpeechGUI(QMainWindow):
         else:
             self.download_status_label.setText("All models downloaded")
             self.download_button.setEnabled(False)
-            self.status_label.setText("Models ready for use")
 
             self.load_voices_from_model()
 
+    def create_kokoro_model(self, model_path):
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = os.cpu_count() or 1
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        available_providers = onnxruntime.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CoreMLExecutionProvider") if p in available_providers]
+        providers.append("CPUExecutionProvider")
+        if not hasattr(kokoro_onnx.Kokoro, "from_session"):
+            self.logger.warning("kokoro_onnx does not support custom sessions. Using default session options.")
+            return kokoro_onnx.Kokoro(str(model_path), str(self.voices_path))
+        session = onnxruntime.InferenceSession(str(model_path), sess_options=opts, providers=providers)
+        self.logger.debug(f"ONNX session created with providers: {session.get_providers()}")
+        return kokoro_onnx.Kokoro.from_session(session, str(self.voices_path))
+
     def load_voices_from_model(self):
+        if self.kokoro_model is not None:
+            self.status_label.setText("Models ready for use")
+            self.on_voices_loaded(self.kokoro_model.get_voices())
+            return
+        self.status_label.setText("Loading model...")
+        # Модель загружается в фоне, чтобы окно появилось сразу; голоса придут через available_voices_signal
+        self.voice_combo.blockSignals(True)
+        self.voice_combo.clear()
+        self.voice_combo.addItems(["Loading voices..."])
+        self.voice_combo.setEnabled(False)
+        self.voice_combo.blockSignals(False)
+        _executor.submit(self.load_model_in_background, self.model_path)
+
+    def load_model_in_background(self, model_path):
         try:
-            import kokoro_onnx
-            model = kokoro_onnx.Kokoro(str(self.model_path), str(self.voices_path))
+            model = self.create_kokoro_model(model_path)
+            run_options = attach_run_options(model)
             voices = model.get_voices()
-            
-            self.voice_combo.blockSignals(True)
-            self.voice_combo.clear()
-            if voices:
-                 self.voice_combo.addItems(voices)
-                 default_voice = "af_heart" if "af_heart" in voices else voices[0]
-                 self.voice_combo.setCurrentText(default_voice)
-            else:
-                 self.voice_combo.addItems(["af_heart"])
-                 self.voice_combo.setCurrentText("af_heart")
-                 self.logger.warning("Model returned an empty list of voices. Using fallback.")
-            self.voice_combo.setEnabled(True)
-            self.voice_combo.blockSignals(False)
         except Exception as e:
-            error_msg = f"Failed to load voices from model: {e}"
+            error_msg = f"Failed to load model: {e}"
             self.logger.error(error_msg)
             print(error_msg)
-            self.voice_combo.blockSignals(True)
-            self.voice_combo.clear()
-            self.voice_combo.addItems(["af_heart"])
-            self.voice_combo.setCurrentText("af_heart")
-            self.voice_combo.setEnabled(True)
-            self.voice_combo.blockSignals(False)
+            self.tts_signals.model_load_error_signal.emit(str(model_path), error_msg)
+            return
+        # Модель передаётся в поток GUI: там же её может сбросить on_precision_changed
+        self.tts_signals.model_loaded_signal.emit(str(model_path), model, run_options, list(voices))
+
+    def on_model_loaded(self, model_path, model, run_options, voices):
+        if model_path != str(self.model_path):
+            self.logger.debug(f"Model precision changed while loading {model_path}. Discarding loaded model.")
+            return
+        self.kokoro_model = model
+        self.run_options = run_options
+        self.status_label.setText("Models ready for use")
+        self.on_voices_loaded(voices)
 
+    def on_model_load_error(self, model_path, error_msg):
+        if model_path != str(self.model_path):
+            return
+        self.status_label.setText(error_msg)
+        self.voice_combo.blockSignals(True)
+        self.voice_combo.clear()
+        self.voice_combo.addItems(["No voices available"])
+        self.voice_combo.setEnabled(False)
+        self.voice_combo.blockSignals(False)
+
+    def on_voices_loaded(self, voices):
+        self.voice_combo.blockSignals(True)
+        self.voice_combo.clear()
+        if voices:
+             self.voice_combo.addItems(voices)
+             default_voice = "af_heart" if "af_heart" in voices else voices[0]
+             self.voice_combo.setCurrentText(default_voice)
+        else:
+             self.voice_combo.addItems(["af_heart"])
+             self.voice_combo.setCurrentText("af_heart")
+             self.logger.warning("Model returned an empty list of voices. Using fallback.")
+        self.voice_combo.setEnabled(True)
+        self.voice_combo.blockSignals(False)
 
     def download_models(self):
         self.download_button.setEnabled(False)
@@ -476,13 +745,16 @@ class TextToSpeechGUI(QMainWindow):
         self.download_file(first_file_path, first_file_url)
 
     def download_file(self, filename, url):
-        self.current_download = DownloadWorker(url, str(filename))
-        self.current_download.download_progress.connect(self.update_download_progress)
-        self.current_download.download_complete.connect(self.on_download_complete)
-        self.current_download.download_error.connect(self.on_download_error)
-        self.current_download.start()
-
-    def update_download_progress(self, progress):
+        self.current_download = DownloadTask(url, str(filename), self.download_session)
+        self.current_download.signals.download_progress.connect(self.update_download_progress)
+        self.current_download.signals.download_complete.connect(self.on_download_complete)
+        self.current_download.signals.download_error.connect(self.on_download_error)
+        _executor.submit(self.current_download.run)
+
+    def update_download_progress(self, downloaded, total_size):
+        progress = downloaded * 100 // total_size
+        if progress == self.progress_bar.value():
+            return
         self.progress_bar.setValue(progress)
         self.status_label.setText(f"Downloading... {progress}%")
 
@@ -493,7 +765,6 @@ class TextToSpeechGUI(QMainWindow):
         if all_downloaded:
             self.download_status_label.setText("All models downloaded")
             self.download_button.setEnabled(False)
-            self.status_label.setText("Models ready for use")
             self.progress_bar.setVisible(False)
             self.load_voices_from_model()
         else:
@@ -510,6 +781,19 @@ class TextToSpeechGUI(QMainWindow):
         print(f"Download error: {error_message}")
         QMessageBox.critical(self, "Error", f"Failed to download file: {error_message}")
 
+    def mark_text_dirty(self):
+        if not self._applying_highlight:
+            self._needs_clear = True
+
+    def on_contents_change(self, position, chars_removed, chars_added):
+        # Правка могла удалить закэшированный блок (clear, setPlainText, ввод) — дальше он ищется по номеру строки
+        self._prev_block = None
+
+    def previous_highlight_block(self):
+        if self._prev_block is not None:
+            return self._prev_block
+        return self.text_edit.document().findBlockByNumber(self.previous_highlighted_line)
+
     def set_all_text_black(self):
         try:
             if self.text_edit.document().isEmpty():
@@ -527,6 +811,7 @@ class TextToSpeechGUI(QMainWindow):
             cursor.mergeCharFormat(fmt)
             cursor.clearSelection()
             self.text_edit.setTextCursor(cursor)
+            self._needs_clear = False
             self.logger.debug("All text color explicitly set to black and background to white at start.")
             print("[INFO] All text color set to black and background to white at start.")
         except Exception as e:
@@ -535,43 +820,29 @@ class TextToSpeechGUI(QMainWindow):
             print(f"[ERROR] {error_msg}")
 
     def clear_text(self):
-        self.text_edit.clear()
         self.clear_highlight()
-
-    def split_text_into_sentences(self, text):
-        """Разделяет текст на предложения по знакам препинания ., !, ? и возвращает список предложений."""
-        import re
-        parts = re.split(r'([.!?])', text)
-        # parts теперь чередуется: [текст, знак, текст, знак, ...]
-        sentences = []
-        for i in range(0, len(parts) - 1, 2): # Идём с шагом 2: текст, затем знак
-            sentence_text = parts[i].strip()
-            punctuation = parts[i + 1] if i + 1 < len(parts) else ''
-            if sentence_text: # Добавляем только непустые предложения
-                full_sentence = sentence_text + punctuation
-                sentences.append(full_sentence)
-        # Обработка случая, если текст не заканчивается на [.!?], но после последнего предложения есть текст в parts[-1]
-        if len(parts) % 2 == 1 and parts[-1].strip():
-            last_part = parts[-1].strip()
-            if last_part: # Если последняя часть не только пробелы
-                pass # Игнорируем хвост без [.!?]
-        return sentences
+        self.text_edit.clear()
 
     def start_synthesis(self):
         if self.synthesis_active:
             self.stop_synthesis()
-        original_text = self.text_edit.toPlainText().strip()
+        current_text = self.text_edit.toPlainText()
+        original_text = current_text.strip()
         if not original_text:
             QMessageBox.warning(self, "Warning", "Please enter text to synthesize")
             return
 
         # --- НОВЫЙ БЛОК: Разделение текста на предложения ---
-        sentences = self.split_text_into_sentences(original_text)
+        sentences = split_text_into_sentences(original_text)
         if sentences:
             # Соединяем предложения с переносом строки
             formatted_text = '\n'.join(sentences)
-            # Обновляем текст в поле ввода
-            self.text_edit.setPlainText(formatted_text)
+            # Обновляем текст в поле ввода, если он ещё не разбит по предложениям
+            if formatted_text != current_text:
+                # setPlainText применяет текущий формат курсора ко всему новому документу — пустой формат делает его однородным
+                self.text_edit.setCurrentCharFormat(QTextCharFormat())
+                self.text_edit.setPlainText(formatted_text)
+                self._needs_clear = False
             # Получаем обновлённый текст для синтеза
             text_to_synthesize = formatted_text
         else:
@@ -579,10 +850,14 @@ class TextToSpeechGUI(QMainWindow):
             text_to_synthesize = original_text
         # --- КОНЕЦ НОВОГО БЛОКА ---
 
-        self.set_all_text_black() # Если нужно сбросить цвета после форматирования
+        if self._needs_clear:
+            self.set_all_text_black() # Если нужно сбросить цвета после форматирования
         if not all(os.path.exists(f) for f in self.model_files.keys()):
             QMessageBox.warning(self, "Error", "Models need to be downloaded before synthesis")
             return
+        if self.kokoro_model is None:
+            QMessageBox.warning(self, "Error", "Model is not loaded")
+            return
         selected_voice = self.voice_combo.currentText()
         if selected_voice in ["Loading voices...", "No voices available", ""]:
             QMessageBox.warning(self, "Error", "Please select a voice")
@@ -593,14 +868,15 @@ class TextToSpeechGUI(QMainWindow):
         lang = "en-us"
         # line_count = len(self.text_edit.toPlainText().split('\n')) # Старый подсчёт
         line_count = len(text_to_synthesize.split('\n')) # Подсчёт по новому тексту
-        self.tts_worker = TTSWorker(text_to_synthesize, selected_voice, speed, lang, self.logger, self.tts_signals, line_count)
+        self.tts_worker = TTSWorker(text_to_synthesize, selected_voice, speed, lang, self.logger, self.tts_signals, line_count, self.kokoro_model, self.synthesis_cache, self.inference_lock, self.run_options)
         self.tts_worker.start()
         self.status_label.setText("Synthesizing and playing...")
         # non_empty_lines = [line for line in original_text.split('\n') if line.strip()] # Старый список
         non_empty_lines = [line for line in text_to_synthesize.split('\n') if line.strip()] # Новый список
         print(f"[PROCESSING] Sentences sent for processing: {len(non_empty_lines)}")
-        for idx, line in enumerate(non_empty_lines):
-            print(f"  [{idx + 1}] {line}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for idx, line in enumerate(non_empty_lines):
+                self.logger.debug(f"  [{idx + 1}] {line}")
 
     def stop_synthesis(self):
         if self.tts_worker:
@@ -612,103 +888,149 @@ class TextToSpeechGUI(QMainWindow):
         self.status_label.setText("Ready")
         self.clear_highlight()
 
-    def on_tts_finished(self):
+    def on_tts_finished(self, non_empty_lines_count):
         self.synthesis_active = False
         self.synthesize_button.setText("Synthesize")
-        text = self.text_edit.toPlainText()
-        non_empty_lines_count = len([line for line in text.split('\n') if line.strip()])
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %I:%M:%S %p")
         print(f"{timestamp}. Sentences: {non_empty_lines_count}")
 
+    def schedule_highlight(self, line_index):
+        self._pending_highlight = line_index
+        if not self._highlight_timer.isActive():
+            # После паузы подсветка применяется на следующем проходе цикла событий, в серии — не чаще раза в кадр
+            elapsed_ms = int((time.monotonic() - self._last_highlight_flush) * 1000)
+            self._highlight_timer.start(max(0, HIGHLIGHT_INTERVAL_MS - elapsed_ms))
+
+    def _flush_highlight(self):
+        self._last_highlight_flush = time.monotonic()
+        line_index = self._pending_highlight
+        self._pending_highlight = -1
+        if line_index >= 0 and line_index != self.previous_highlighted_line:
+            self.highlight_line(line_index)
+
+    def block_cursor(self, block):
+        # Выделение всего блока по позициям, без вычисления границ строки через раскладку
+        cursor = QTextCursor(block)
+        cursor.setPosition(block.position() + block.length() - 1, QTextCursor.KeepAnchor)
+        return cursor
+
     def highlight_line(self, line_index):
-        block_count = self.text_edit.document().blockCount()
-        if 0 <= line_index < block_count:
-            block = self.text_edit.document().findBlockByNumber(line_index)
-            if block.isValid():
-                if 0 <= self.previous_highlighted_line < block_count:
-                    prev_block = self.text_edit.document().findBlockByNumber(self.previous_highlighted_line)
+        document = self.text_edit.document()
+        block = document.findBlockByNumber(line_index)
+        if block.isValid():
+            # Снятие старой и установка новой подсветки — одна правка документа: одно уведомление и одна перерисовка
+            edit_cursor = QTextCursor(document)
+            self._applying_highlight = True
+            edit_cursor.beginEditBlock()
+            try:
+                if self.previous_highlighted_line >= 0 and self.previous_highlighted_line != line_index:
+                    prev_block = self.previous_highlight_block()
                     if prev_block.isValid():
-                        prev_cursor = QTextCursor(prev_block)
-                        prev_fmt = QTextCharFormat()
-                        prev_fmt.clearBackground()
-                        prev_fmt.clearForeground()
-                        prev_fmt.setFontWeight(QFont.Weight.Normal)
-                        prev_cursor.select(QTextCursor.LineUnderCursor)
-                        prev_cursor.mergeCharFormat(prev_fmt)
-
-                cursor = QTextCursor(block)
-                fmt = QTextCharFormat()
-                fmt.setForeground(QBrush(QColor(0, 0, 255)))
-                fmt.setFontWeight(QFont.Weight.Bold)
-                cursor.select(QTextCursor.LineUnderCursor)
-                cursor.mergeCharFormat(fmt)
-                cursor.movePosition(QTextCursor.StartOfBlock)
-                self.text_edit.setTextCursor(cursor)
-                self.text_edit.ensureCursorVisible()
-                self.previous_highlighted_line = line_index
-                print(f"[HIGHLIGHT] Line {line_index + 1} highlighted.")
+                        prev_cursor = self.block_cursor(prev_block)
+                        prev_cursor.mergeCharFormat(self._clear_fmt)
+
+                cursor = self.block_cursor(block)
+                cursor.mergeCharFormat(self._highlight_fmt)
+            finally:
+                edit_cursor.endEditBlock()
+                self._applying_highlight = False
+            cursor.movePosition(QTextCursor.StartOfBlock)
+            self.text_edit.setTextCursor(cursor)
+            self.text_edit.ensureCursorVisible()
+            self.previous_highlighted_line = line_index
+            self._prev_block = block
+            self.logger.debug("Highlight line %d", line_index + 1)
 
     def clear_highlight(self):
-        if 0 <= self.previous_highlighted_line < self.text_edit.document().blockCount():
-            prev_block = self.text_edit.document().findBlockByNumber(self.previous_highlighted_line)
-            if prev_block.isValid():
-                prev_cursor = QTextCursor(prev_block)
-                prev_fmt = QTextCharFormat()
-                prev_fmt.clearBackground()
-                prev_fmt.clearForeground()
-                prev_fmt.setFontWeight(QFont.Weight.Normal)
-                prev_cursor.select(QTextCursor.LineUnderCursor)
-                prev_cursor.mergeCharFormat(prev_fmt)
+        self._highlight_timer.stop()
+        self._pending_highlight = -1
+        if self.previous_highlighted_line < 0:
+            return
+        prev_block = self.previous_highlight_block()
+        if prev_block.isValid():
+            prev_cursor = self.block_cursor(prev_block)
+            self._applying_highlight = True
+            try:
+                prev_cursor.mergeCharFormat(self._clear_fmt)
+            finally:
+                self._applying_highlight = False
+        self._prev_block = None
         self.previous_highlighted_line = -1
 
     def closeEvent(self, event):
         self.stop_synthesis()
+        if self.current_download is not None:
+            self.current_download.cancel()
         event.accept()
 
-class DownloadWorker(QThread):
-    download_progress = Signal(int)
+class DownloadSignals(QObject):
+    download_progress = Signal(int, int)
     download_complete = Signal(str)
     download_error = Signal(str)
 
-    def __init__(self, url, filename):
-        super().__init__()
+class DownloadTask:
+    def __init__(self, url, filename, session):
         self.url = url
         self.filename = filename
+        self.session = session
+        self.signals = DownloadSignals()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
 
     def run(self):
         try:
-            response = requests.get(self.url, stream=True)
-            total_size = int(response.headers.get('content-length', 0))
-            with open(self.filename, 'wb') as file:
-                downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
+            with self.session.get(self.url, stream=True, timeout=(5, 30)) as response:
+                # HTTP-ошибка не должна записаться на диск вместо модели
+                response.raise_for_status()
+                total_size = int(response.headers.get('content-length', 0))
+                # Чтение напрямую из urllib3 без генератора iter_content; распаковка gzip/deflate остаётся включённой
+                response.raw.decode_content = True
+                read = response.raw.read
+                with open(self.filename, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as file:
+                    downloaded = 0
+                    last_emit = 0.0
+                    while not self._cancel_event.is_set():
+                        chunk = read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
                         file.write(chunk)
                         downloaded += len(chunk)
                         if total_size > 0:
-                            progress = int((downloaded / total_size) * 100)
-                            self.download_progress.emit(progress)
-            self.download_complete.emit(self.filename)
+                            # Сигнал не чаще ~30 раз в секунду; процент считает GUI, когда обновляет индикатор
+                            now = time.monotonic()
+                            if now - last_emit >= DOWNLOAD_PROGRESS_INTERVAL:
+                                last_emit = now
+                                self.signals.download_progress.emit(downloaded, total_size)
+            if self._cancel_event.is_set():
+                # Недокачанный файл не должен сойти за скачанную модель при следующем запуске
+                os.remove(self.filename)
+                return
+            self.signals.download_complete.emit(self.filename)
         except Exception as e:
-            self.download_error.emit(str(e))
+            self.signals.download_error.emit(str(e))
 
 def main():
-    required_packages = ['kokoro_onnx', 'soundfile', 'numpy', 'PySide6', 'pyaudio']
+    required_packages = ['kokoro_onnx', 'onnxruntime', 'soundfile', 'numpy', 'PySide6', 'pyaudio']
     missing_packages = []
     for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
+        if importlib.util.find_spec(package) is None:
             missing_packages.append(package)
 
     if missing_packages:
-        error_msg = f"Required packages not found:\nNo module named '{missing_packages[0]}'\n"
+        error_msg = "Required packages not found:\n" + "\n".join(f"No module named '{p}'" for p in missing_packages) + "\n"
         error_msg += "Install them with command:\npip install kokoro-onnx soundfile numpy PySide6 pyaudio"
         print(error_msg)
         print("\nTo install dependencies run:")
         print("pip install kokoro-onnx soundfile numpy PySide6 pyaudio")
         sys.exit(1)
 
+    if _IMPORT_ERROR is not None:
+        # Пакет установлен, но не импортируется — показываем настоящую причину
+        print(f"Failed to import required packages: {_IMPORT_ERROR}")
+        sys.exit(1)
+
     app = QApplication(sys.argv)
     window = TextToSpeechGUI()
     window.show()